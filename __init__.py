@@ -27,12 +27,16 @@ require("nonebot_plugin_apscheduler")
 from .config import Config
 from .handler import (
     group_join_handler,
+    group_request_handler,
     verify_answer_handler,
     admin_approve_handler,
     admin_reject_handler,
     admin_approve_kw,
     admin_reject_kw,
     help_handler,
+    admin_profile_handler,
+    admin_revoke_handler,
+    admin_dedup_handler,
 )
 
 __plugin_meta__ = PluginMetadata(
@@ -52,10 +56,14 @@ __plugin_meta__ = PluginMetadata(
 
 __all__ = [
     "group_join_handler",
+    "group_request_handler",
     "verify_answer_handler",
     "admin_approve_handler",
     "admin_reject_handler",
     "admin_approve_kw",
     "admin_reject_kw",
     "help_handler",
+    "admin_profile_handler",
+    "admin_revoke_handler",
+    "admin_dedup_handler",
 ]
\ No newline at end of file
@@ -3,7 +3,7 @@ chiral_carbon_verify/config.py
 """
 
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal
 
 
 class Config(BaseModel):
@@ -37,4 +37,102 @@ class Config(BaseModel):
     chiral_verify_admin_ids: List[int] = []
 
     # 是否在群聊临时会话发送题目（False 则在群内 @）
-    chiral_verify_use_temp_conversation: bool = True
\ No newline at end of file
+    chiral_verify_use_temp_conversation: bool = True
+
+    # 在入群申请阶段验证（需机器人为群管理员）：私聊发题，答对同意申请、答错拒绝，
+    # 无法私聊申请人时同意申请并在入群后按常规流程验证
+    chiral_verify_request_mode: bool = False
+
+    # 同一答案在该秒数内重复提交时忽略（防刷屏导致重复计次 / 重复回复）
+    chiral_verify_answer_debounce: float = 2.0
+
+    # ----------------------------------------------------------------
+    # 链路追踪与性能剖析
+    # ----------------------------------------------------------------
+
+    # 是否记录每次验证的链路 trace
+    chiral_verify_trace_enabled: bool = True
+
+    # trace 文件路径（JSON Lines，按大小滚动）
+    chiral_verify_trace_path: str = "data/chiral_verify/trace.jsonl"
+
+    # 单个 trace 文件最大字节数
+    chiral_verify_trace_max_bytes: int = 5 * 1024 * 1024
+
+    # 保留的历史 trace 文件数
+    chiral_verify_trace_backup_count: int = 3
+
+    # 性能剖析结果输出目录
+    chiral_verify_profile_dir: str = "data/chiral_verify/profile"
+
+    # 单次剖析最长秒数
+    chiral_verify_profile_max_seconds: int = 300
+
+    # ----------------------------------------------------------------
+    # 过载保护
+    # ----------------------------------------------------------------
+
+    # 全局待验证会话上限（0 表示不限制）
+    chiral_verify_max_sessions: int = 500
+
+    # 单群待验证会话上限（0 表示不限制）
+    chiral_verify_max_sessions_per_group: int = 50
+
+    # 达到上限时的策略：kick（直接移出）/ queue（排队）/ lockdown（暂停该群新验证）
+    chiral_verify_overload_policy: Literal["kick", "queue", "lockdown"] = "queue"
+
+    # 单群排队上限，队列满后按 kick 处理
+    chiral_verify_queue_size: int = 200
+
+    # lockdown 策略的锁定时长（秒）
+    chiral_verify_lockdown_seconds: int = 300
+
+    # 突发入群检测：窗口（秒）内入群人数达到阈值即告警（阈值 0 表示关闭）
+    chiral_verify_raid_window: int = 60
+    chiral_verify_raid_threshold: int = 10
+
+    # ----------------------------------------------------------------
+    # 题目图片发送方式
+    # ----------------------------------------------------------------
+
+    # base64（内联发送）/ file（file:// 本地路径）/ http（内置 HTTP 服务）
+    chiral_verify_image_mode: Literal["base64", "file", "http"] = "base64"
+
+    # 图片存放目录（file / http 模式），会话结束后自动清理
+    chiral_verify_image_dir: str = "data/chiral_verify/images"
+
+    # 内置 HTTP 服务监听地址（http 模式）
+    chiral_verify_image_http_host: str = "127.0.0.1"
+    chiral_verify_image_http_port: int = 9998
+
+    # OneBot 实现访问图片使用的地址，留空则为 http://<host>:<port>
+    chiral_verify_image_base_url: str = ""
+
+    # ----------------------------------------------------------------
+    # 跨群已验证用户缓存
+    # ----------------------------------------------------------------
+
+    # 通过验证的用户在有效期内加入其他群时免验证
+    chiral_verify_verified_cache_enabled: bool = False
+
+    # 共享缓存的群号列表（空列表表示所有群）
+    chiral_verify_verified_cache_groups: List[int] = []
+
+    # 有效期（秒，默认 30 天）
+    chiral_verify_verified_cache_ttl: int = 30 * 24 * 3600
+
+    # 最多保留的用户数
+    chiral_verify_verified_cache_size: int = 10000
+
+    # 缓存文件路径
+    chiral_verify_verified_cache_path: str = "data/chiral_verify/verified.json"
+
+    # ----------------------------------------------------------------
+    # 题目去重
+    # ----------------------------------------------------------------
+
+    # 每个群记录最近发出的题目数，窗口内重复的题目会被丢弃重拉（0 表示关闭）
+    chiral_verify_dedup_window: int = 20
+
+    # 拉到重复题目时的最多重拉次数，用尽后仍发出该题
+    chiral_verify_dedup_retries: int = 2
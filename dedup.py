@@ -0,0 +1,73 @@
+"""
+chiral_carbon_verify/dedup.py
+按群去重近期发出的题目
+
+每个群保留最近 N 道题目的 ID（环形缓冲 + 集合，判断与插入均为 O(1)，内存固定），
+拉到近期已发过的题目时由调用方重新拉取，避免同一道题在突发入群时被多人共用答案。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+
+class RecentWindow:
+    """固定容量的近期题目窗口。"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ring: List[Optional[str]] = [None] * size
+        self._pos = 0
+        self._ids: Set[str] = set()
+
+    def __contains__(self, question_id: str) -> bool:
+        return question_id in self._ids
+
+    def add(self, question_id: str) -> None:
+        if question_id in self._ids:
+            return
+        evicted = self._ring[self._pos]
+        if evicted is not None:
+            self._ids.discard(evicted)
+        self._ring[self._pos] = question_id
+        self._ids.add(question_id)
+        self._pos = (self._pos + 1) % self.size
+
+
+@dataclass
+class DedupStats:
+    hits: int = 0        # 拉到近期已发过的题目（被丢弃重拉）
+    misses: int = 0      # 拉到未重复的题目
+    exhausted: int = 0   # 重拉次数用尽，仍发出了重复题目
+
+
+_windows: Dict[int, RecentWindow] = {}
+_stats: Dict[int, DedupStats] = {}
+
+
+def check_and_remember(group_id: int, question_id: str, size: int) -> bool:
+    """
+    判断题目在该群是否为近期新题；是则记入窗口并返回 True，重复则返回 False。
+    size <= 0 或题目无 ID 时不去重。
+    """
+    if size <= 0 or not question_id:
+        return True
+    window = _windows.get(group_id)
+    if window is None or window.size != size:
+        window = _windows[group_id] = RecentWindow(size)
+    stats = _stats.setdefault(group_id, DedupStats())
+
+    if question_id in window:
+        stats.hits += 1
+        return False
+    stats.misses += 1
+    window.add(question_id)
+    return True
+
+
+def record_exhausted(group_id: int) -> None:
+    """重拉次数用尽、只能发出重复题目时调用。"""
+    _stats.setdefault(group_id, DedupStats()).exhausted += 1
+
+
+def get_stats() -> Dict[int, DedupStats]:
+    return dict(_stats)
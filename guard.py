@@ -0,0 +1,196 @@
+"""
+chiral_carbon_verify/guard.py
+过载保护
+
+1. 会话配额     — 全局 / 单群待验证会话上限（含正在拉题的预占名额）
+2. 排队         — 超出上限的新成员按群排队，名额释放后依次验证
+3. 锁定         — 短时间内暂停某群的新验证
+4. 入群速率     — 按秒分桶的滑动窗口，O(1) 统计各群入群速率并识别突发入群
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .session import count_sessions, count_group_sessions
+
+
+# ---------------------------------------------------------------------------
+# 入群速率
+# ---------------------------------------------------------------------------
+
+class JoinRateMeter:
+    """按秒分桶的滑动窗口计数器，每次记录为摊还 O(1)，内存固定为窗口秒数。"""
+
+    def __init__(self, window: int):
+        self.window = max(1, window)
+        self._buckets = [0] * self.window
+        self._last_sec = int(time.time())
+        self._total = 0
+
+    def record(self, now: float) -> int:
+        """记录一次入群，返回窗口内的入群总数。"""
+        sec = int(now)
+        self._advance(sec)
+        self._buckets[sec % self.window] += 1
+        self._total += 1
+        return self._total
+
+    def _advance(self, sec: int) -> None:
+        gap = sec - self._last_sec
+        if gap <= 0:
+            return
+        if gap >= self.window:
+            self._buckets = [0] * self.window
+            self._total = 0
+        else:
+            for s in range(self._last_sec + 1, sec + 1):
+                idx = s % self.window
+                self._total -= self._buckets[idx]
+                self._buckets[idx] = 0
+        self._last_sec = sec
+
+
+_meters: Dict[int, JoinRateMeter] = {}
+_raiding: Set[int] = set()
+
+
+def record_join(group_id: int, window: int, threshold: int) -> Tuple[int, bool]:
+    """
+    记录一次入群。
+    :returns: (窗口内入群数, 是否刚刚进入突发入群状态)
+    """
+    meter = _meters.get(group_id)
+    if meter is None or meter.window != max(1, window):
+        meter = _meters[group_id] = JoinRateMeter(window)
+    rate = meter.record(time.time())
+
+    if rate >= threshold > 0:
+        if group_id not in _raiding:
+            _raiding.add(group_id)
+            return rate, True
+    else:
+        _raiding.discard(group_id)
+    return rate, False
+
+
+# ---------------------------------------------------------------------------
+# 会话配额
+# ---------------------------------------------------------------------------
+
+# 已准入但尚未建立会话（正在拉题 / 发题）的名额
+_inflight: Dict[int, int] = {}
+_inflight_total = 0
+
+
+def try_admit(group_id: int, max_total: int, max_per_group: int) -> bool:
+    """检查上限并预占一个名额；成功后调用方必须在结束时 release_admit。"""
+    global _inflight_total
+    if max_total > 0 and count_sessions() + _inflight_total >= max_total:
+        return False
+    if (
+        max_per_group > 0
+        and count_group_sessions(group_id) + _inflight.get(group_id, 0) >= max_per_group
+    ):
+        return False
+    _inflight[group_id] = _inflight.get(group_id, 0) + 1
+    _inflight_total += 1
+    return True
+
+
+def release_admit(group_id: int) -> None:
+    global _inflight_total
+    if group_id not in _inflight:
+        return
+    _inflight_total -= 1
+    left = _inflight.get(group_id, 0) - 1
+    if left > 0:
+        _inflight[group_id] = left
+    else:
+        _inflight.pop(group_id, None)
+
+
+# ---------------------------------------------------------------------------
+# 排队
+# ---------------------------------------------------------------------------
+
+# group_id → 有序集合（user_id → (入群申请 flag, 入队时间)），已入群的成员 flag 为空串
+_queues: Dict[int, "OrderedDict[int, Tuple[str, float]]"] = {}
+
+
+def enqueue(group_id: int, user_id: int, max_size: int, flag: str = "") -> bool:
+    """加入该群等待队列；队列已满时返回 False。"""
+    queue = _queues.setdefault(group_id, OrderedDict())
+    if user_id in queue:
+        old_flag, enqueued_at = queue[user_id]
+        queue[user_id] = (flag or old_flag, enqueued_at)
+        return True
+    if len(queue) >= max_size:
+        return False
+    queue[user_id] = (flag, time.time())
+    return True
+
+
+def dequeue(group_id: int) -> Optional[Tuple[int, str]]:
+    """取出最早排队的成员，返回 (user_id, flag)。"""
+    queue = _queues.get(group_id)
+    if not queue:
+        return None
+    user_id, (flag, _) = queue.popitem(last=False)
+    if not queue:
+        del _queues[group_id]
+    return user_id, flag
+
+
+def pop_stale_queued(max_age: float) -> List[Tuple[int, int, str]]:
+    """
+    取出排队超过 max_age 秒的成员，返回 [(group_id, user_id, flag)]。
+    队列按入队时间排列，只需检查各队列头部。
+    """
+    cutoff = time.time() - max_age
+    stale: List[Tuple[int, int, str]] = []
+    for group_id in list(_queues):
+        queue = _queues[group_id]
+        while queue:
+            user_id, (flag, enqueued_at) = next(iter(queue.items()))
+            if enqueued_at > cutoff:
+                break
+            del queue[user_id]
+            stale.append((group_id, user_id, flag))
+        if not queue:
+            del _queues[group_id]
+    return stale
+
+
+def queue_length(group_id: int) -> int:
+    queue = _queues.get(group_id)
+    return len(queue) if queue else 0
+
+
+def queued_groups() -> List[int]:
+    return list(_queues)
+
+
+# ---------------------------------------------------------------------------
+# 锁定
+# ---------------------------------------------------------------------------
+
+_lockdowns: Dict[int, float] = {}
+
+
+def start_lockdown(group_id: int, seconds: int) -> None:
+    _lockdowns[group_id] = time.time() + seconds
+
+
+def is_locked_down(group_id: int) -> bool:
+    until = _lockdowns.get(group_id)
+    return until is not None and time.time() < until
+
+
+def pop_finished_lockdowns() -> List[int]:
+    """取出已到期的锁定群号（每个群只返回一次）。"""
+    now = time.time()
+    finished = [gid for gid, until in _lockdowns.items() if now >= until]
+    for gid in finished:
+        del _lockdowns[gid]
+    return finished
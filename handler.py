@@ -3,6 +3,7 @@ chiral_carbon_verify/handler.py
 事件处理器
 
 1. group_join_handler      — 监听成员入群通知，发送验证题目（不禁言）
+   group_request_handler   — 监听入群申请，验证通过后同意申请（需开启申请阶段验证）
 2. verify_answer_handler   — 接收私聊/群聊纯数字答案
 3. admin_approve_handler   — /approve <QQ>（管理员，需 / 前缀）
 4. admin_reject_handler    — /reject  <QQ>（管理员，需 / 前缀）
@@ -10,14 +11,20 @@ chiral_carbon_verify/handler.py
 6. admin_reject_kw         — 手动拒绝 <QQ>（无需前缀）
 7. help_handler            — 手性碳帮助 / CChelp（无需前缀）
 8. timeout_checker         — 定时任务，超时踢出
+9. admin_profile_handler   — /ccprofile cpu|lag <秒数>（管理员，需 / 前缀）
+10. admin_revoke_handler   — /ccrevoke <QQ>（管理员，需 / 前缀），撤销跨群免验证
+11. admin_dedup_handler    — /ccdedup（管理员，需 / 前缀），查看题目去重统计
 """
 
+import asyncio
 import re
+from typing import Set
 
-from nonebot import get_bot, on_notice, on_command, on_message, require
+from nonebot import get_bot, get_driver, on_notice, on_command, on_message, on_request, require
 from nonebot.adapters.onebot.v11 import (
     Bot,
     GroupIncreaseNoticeEvent,
+    GroupRequestEvent,
     GroupMessageEvent,
     PrivateMessageEvent,
     MessageSegment,
@@ -32,15 +39,48 @@ from nonebot.plugin import get_plugin_config
 require("nonebot_plugin_apscheduler")
 from nonebot_plugin_apscheduler import scheduler
 
+from . import profiler
 from .config import Config
-from .questions import fetch_captcha, verify_answer
+from .dedup import check_and_remember, record_exhausted, get_stats as get_dedup_stats
+from .guard import (
+    record_join,
+    try_admit,
+    release_admit,
+    enqueue,
+    dequeue,
+    queue_length,
+    queued_groups,
+    start_lockdown,
+    is_locked_down,
+    pop_finished_lockdowns,
+    pop_stale_queued,
+)
+from .image_host import ImageHost
+from .questions import CaptchaQuestion, fetch_captcha, verify_answer
 from .session import (
+    VerifySession,
+    add_session_end_hook,
     create_session,
     get_session,
     remove_session,
     get_expired_sessions,
+    pop_expired_session,
     increment_attempt,
+    mark_request_approved,
+    pop_request_approved,
+    pending_count,
+    session_lock,
+)
+from .tracing import (
+    setup_trace_writer,
+    stop_trace_writer,
+    start_trace,
+    resume_trace,
+    finish_trace,
+    mark,
+    span,
 )
+from .verified_cache import VerifiedCache
 
 # ---------------------------------------------------------------------------
 # 配置
@@ -48,11 +88,94 @@ from .session import (
 
 config: Config = get_plugin_config(Config)
 
+if config.chiral_verify_trace_enabled:
+
+    @get_driver().on_startup
+    async def _start_trace_writer():
+        setup_trace_writer(
+            config.chiral_verify_trace_path,
+            config.chiral_verify_trace_max_bytes,
+            config.chiral_verify_trace_backup_count,
+        )
+
+    @get_driver().on_shutdown
+    async def _stop_trace_writer():
+        stop_trace_writer()
+
+image_host: ImageHost | None = None
+if config.chiral_verify_image_mode != "base64":
+    image_host = ImageHost(
+        config.chiral_verify_image_dir,
+        config.chiral_verify_image_mode,
+        config.chiral_verify_image_base_url
+        or f"http://{config.chiral_verify_image_http_host}:{config.chiral_verify_image_http_port}",
+    )
+
+    def _release_session_image(session: VerifySession) -> None:
+        if not session.image_name:
+            return
+        try:
+            image_host.release(session.image_name)
+        except OSError as e:
+            logger.warning(f"[手性碳验证] 删除题目图片失败: {e}")
+
+    add_session_end_hook(_release_session_image)
+
+    @get_driver().on_startup
+    async def _start_image_host():
+        image_host.clear()
+        if config.chiral_verify_image_mode == "http":
+            await image_host.start_http(
+                config.chiral_verify_image_http_host,
+                config.chiral_verify_image_http_port,
+            )
+            logger.info(f"[手性碳验证] 题目图片服务已启动: {image_host.base_url}")
+
+    @get_driver().on_shutdown
+    async def _stop_image_host():
+        await image_host.stop_http()
+        image_host.clear()
+
+verified_cache: VerifiedCache | None = None
+if config.chiral_verify_verified_cache_enabled:
+    verified_cache = VerifiedCache(
+        config.chiral_verify_verified_cache_path,
+        config.chiral_verify_verified_cache_ttl,
+        config.chiral_verify_verified_cache_size,
+    )
+
+    @get_driver().on_startup
+    async def _load_verified_cache():
+        try:
+            verified_cache.load()
+            logger.info(f"[手性碳验证] 已加载跨群验证缓存 {len(verified_cache)} 条")
+        except Exception as e:
+            logger.error(f"[手性碳验证] 加载跨群验证缓存失败: {e}")
+
+    @get_driver().on_shutdown
+    async def _save_verified_cache():
+        try:
+            verified_cache.save()
+        except Exception as e:
+            logger.error(f"[手性碳验证] 保存跨群验证缓存失败: {e}")
+
 # ---------------------------------------------------------------------------
 # 工具
 # ---------------------------------------------------------------------------
 
-def _make_img_segment(image_base64: str) -> MessageSegment:
+def _in_cache_scope(group_id: int) -> bool:
+    groups = config.chiral_verify_verified_cache_groups
+    return verified_cache is not None and (not groups or group_id in groups)
+
+
+def _record_pass(user_id: int, group_id: int) -> None:
+    if _in_cache_scope(group_id):
+        verified_cache.add(user_id)
+
+
+def _make_img_segment(image_base64: str, image_name: str = "") -> MessageSegment:
+    if image_host is not None and image_name:
+        return MessageSegment.image(image_host.url_for(image_name))
     b64 = image_base64
     if "," in b64:
         b64 = b64.split(",", 1)[1]
@@ -75,7 +198,10 @@ def _help_text() -> str:
         "  /approve <QQ号>        手动通过验证\n"
         "  /reject  <QQ号> [原因] 手动踢出用户\n"
         "  手动通过 <QQ号>        同上（无需前缀）\n"
-        "  手动拒绝 <QQ号> [原因] 同上（无需前缀）\n\n"
+        "  手动拒绝 <QQ号> [原因] 同上（无需前缀）\n"
+        "  /ccprofile cpu|lag <秒数> 性能剖析\n"
+        "  /ccrevoke <QQ号>       撤销跨群免验证\n"
+        "  /ccdedup               查看题目去重统计\n\n"
         f"⚙️ 当前配置\n"
         f"  验证时限：{timeout_min} 分钟\n"
         f"  最大尝试：{config.chiral_verify_max_attempts} 次\n"
@@ -97,22 +223,104 @@ async def handle_group_join(bot: Bot, event: GroupIncreaseNoticeEvent):
 
     if user_id == event.self_id:
         return
+    request_verified = pop_request_approved(user_id, group_id)
+    if request_verified:
+        logger.info(f"[手性碳验证] {user_id} 已在入群申请阶段通过验证，跳过")
+        return
 
     logger.info(f"[手性碳验证] 新成员入群: user={user_id}, group={group_id}, sub_type={event.sub_type}")
+    if config.chiral_verify_trace_enabled:
+        start_trace(user_id, group_id)
+        mark("join", sub_type=event.sub_type)
 
-    try:
-        question = await fetch_captcha(
-            api_base=config.chiral_verify_api_base,
-            timeout=config.chiral_verify_api_timeout,
+    # 申请阶段回退放行的成员已在收到申请时计入入群速率
+    await _admit_new_user(bot, user_id, group_id, count_rate=request_verified is None)
+
+
+# ---------------------------------------------------------------------------
+# 1.1 入群申请处理器（CHIRAL_VERIFY_REQUEST_MODE 开启时）
+# ---------------------------------------------------------------------------
+
+group_request_handler = on_request(priority=5)
+
+
+@group_request_handler.handle()
+async def handle_group_request(bot: Bot, event: GroupRequestEvent):
+    if not config.chiral_verify_request_mode or event.sub_type != "add":
+        return
+
+    user_id  = event.user_id
+    group_id = event.group_id
+    logger.info(f"[手性碳验证] 收到入群申请: user={user_id}, group={group_id}")
+    if config.chiral_verify_trace_enabled:
+        start_trace(user_id, group_id)
+        mark("request")
+
+    await _admit_new_user(bot, user_id, group_id, flag=event.flag)
+
+
+async def _admit_new_user(
+    bot: Bot,
+    user_id: int,
+    group_id: int,
+    flag: str = "",
+    count_rate: bool = True,
+) -> None:
+    """入群 / 入群申请的公共入口：统计入群速率，按配额发起验证或交由过载策略处理。"""
+    if count_rate:
+        rate, raid_started = record_join(
+            group_id,
+            config.chiral_verify_raid_window,
+            config.chiral_verify_raid_threshold,
+        )
+        if raid_started:
+            logger.warning(
+                f"[手性碳验证] 群 {group_id} 疑似批量入群："
+                f"{config.chiral_verify_raid_window} 秒内 {rate} 人"
+            )
+
+    if _in_cache_scope(group_id) and verified_cache.contains(user_id):
+        logger.info(f"[手性碳验证] {user_id} 近期已在其他群通过验证，跳过（群 {group_id}）")
+        mark("verified_cache_hit")
+        if flag:
+            await _approve_request(bot, user_id, group_id, flag)
+        finish_trace(user_id, "cached_pass")
+        return
+
+    if (
+        is_locked_down(group_id)
+        or queue_length(group_id) > 0
+        or not try_admit(
+            group_id,
+            config.chiral_verify_max_sessions,
+            config.chiral_verify_max_sessions_per_group,
         )
+    ):
+        await _handle_overload(bot, user_id, group_id, flag)
+        return
+
+    try:
+        await _start_verification(bot, user_id, group_id, flag)
+    finally:
+        release_admit(group_id)
+
+
+async def _start_verification(bot: Bot, user_id: int, group_id: int, flag: str = "") -> None:
+    """
+    拉取题目、建立会话并发送题目。调用方需已通过 try_admit 占用名额。
+    flag 非空表示入群申请阶段的验证：题目只能私聊发送，结果通过处理申请体现。
+    """
+    try:
+        question = await _fetch_unique_captcha(group_id)
     except Exception as e:
         logger.error(f"[手性碳验证] 获取验证码失败: {e}")
+        finish_trace(user_id, "api_error")
         for admin_id in config.chiral_verify_admin_ids:
             try:
                 await bot.send_private_msg(
                     user_id=admin_id,
                     message=(
-                        f"⚠️ 手性碳验证 API 不可用，请手动审核新成员。\n"
+                        f"⚠️ 手性碳验证 API 不可用，请手动审核{'入群申请' if flag else '新成员'}。\n"
                         f"用户：{user_id}，群：{group_id}\n"
                         f"错误：{e}"
                     ),
@@ -121,26 +329,41 @@ async def handle_group_join(bot: Bot, event: GroupIncreaseNoticeEvent):
                 pass
         return
 
-    create_session(
+    session = create_session(
         user_id=user_id,
         group_id=group_id,
         question=question,
         max_attempts=config.chiral_verify_max_attempts,
         timeout=config.chiral_verify_timeout,
+        flag=flag,
     )
+    if image_host is not None:
+        try:
+            session.image_name = image_host.publish(question.image_base64)
+        except Exception as e:
+            logger.warning(f"[手性碳验证] 本地托管图片失败，改用 base64 发送: {e}")
 
     timeout_min = config.chiral_verify_timeout // 60
     name_part   = f"（{question.molecule_name}）" if question.molecule_name else ""
-    img_seg     = _make_img_segment(question.image_base64)
+    img_seg     = _make_img_segment(question.image_base64, session.image_name)
 
-    intro = (
-        f"\n👋 你好！你刚加入了群 {group_id}，需要完成手性碳识别验证才算入群成功。\n\n"
-        f"📚 【验证题目】{name_part}\n"
-        f"请观察下方分子结构图，回复图中手性碳的数量（纯数字，如 2）。\n"
-    )
+    if flag:
+        intro = (
+            f"\n👋 你好！你申请加入群 {group_id}，需要先完成手性碳识别验证，通过后自动同意申请。\n\n"
+            f"📚 【验证题目】{name_part}\n"
+            f"请观察下方分子结构图，回复图中手性碳的数量（纯数字，如 2）。\n"
+        )
+        fail_hint = "验证失败或超时将拒绝入群申请。"
+    else:
+        intro = (
+            f"\n👋 你好！你刚加入了群 {group_id}，需要完成手性碳识别验证才算入群成功。\n\n"
+            f"📚 【验证题目】{name_part}\n"
+            f"请观察下方分子结构图，回复图中手性碳的数量（纯数字，如 2）。\n"
+        )
+        fail_hint = "验证失败或超时将被移出群聊。"
     hint = (
         f"\n⏰ 限时 {timeout_min} 分钟，共 {config.chiral_verify_max_attempts} 次机会。\n"
-        f"验证失败或超时将被移出群聊。\n"
+        f"{fail_hint}\n"
         f"发送 手性碳帮助 或 CChelp 可查看说明。"
     )
 
@@ -148,34 +371,207 @@ async def handle_group_join(bot: Bot, event: GroupIncreaseNoticeEvent):
 
     sent_private = False
     try:
-        await bot.send_private_msg(user_id=user_id, message=private_msg)
+        with span("send_private"):
+            await bot.send_private_msg(user_id=user_id, message=private_msg)
         sent_private = True
         logger.info(f"[手性碳验证] 已私聊 {user_id} 发送验证题目")
     except Exception as e:
-        logger.warning(f"[手性碳验证] 私聊失败，回退群内发送: {e}")
+        logger.warning(f"[手性碳验证] 私聊失败，回退{'入群后验证' if flag else '群内发送'}: {e}")
+
+    if flag:
+        if not sent_private:
+            # 申请人尚未入群且无法私聊：同意申请，入群后按常规流程验证
+            remove_session(user_id)
+            mark_request_approved(user_id, group_id, verified=False)
+            try:
+                with span("approve_request", fallback=True):
+                    await bot.set_group_add_request(flag=flag, sub_type="add", approve=True)
+            except Exception as e:
+                logger.error(f"[手性碳验证] 处理入群申请失败: {e}")
+            finish_trace(user_id, "request_fallback")
+        return
 
     if sent_private:
         try:
-            await bot.send_group_msg(
-                group_id=group_id,
-                message=(
-                    f"[CQ:at,qq={user_id}] 验证题目已通过私聊发送，"
-                    f"请查看私信并直接回复手性碳数量（纯数字）。\n"
-                    f"限时 {timeout_min} 分钟，共 {config.chiral_verify_max_attempts} 次机会，"
-                    f"超时或答错将被移出群聊。"
-                ),
-            )
+            with span("send_group_hint"):
+                await bot.send_group_msg(
+                    group_id=group_id,
+                    message=(
+                        f"[CQ:at,qq={user_id}] 验证题目已通过私聊发送，"
+                        f"请查看私信并直接回复手性碳数量（纯数字）。\n"
+                        f"限时 {timeout_min} 分钟，共 {config.chiral_verify_max_attempts} 次机会，"
+                        f"超时或答错将被移出群聊。"
+                    ),
+                )
         except Exception as e:
             logger.warning(f"[手性碳验证] 群内提示失败: {e}")
     else:
         group_msg = MessageSegment.at(user_id) + MessageSegment.text(intro) + img_seg + MessageSegment.text(hint)
         try:
-            await bot.send_group_msg(group_id=group_id, message=group_msg)
+            with span("send_group_fallback"):
+                await bot.send_group_msg(group_id=group_id, message=group_msg)
             logger.info(f"[手性碳验证] 已群内向 {user_id} 发题（回退）")
         except Exception as e:
             logger.error(f"[手性碳验证] 发送题目失败: {e}")
 
 
+async def _fetch_unique_captcha(group_id: int) -> CaptchaQuestion:
+    """
+    拉取题目，丢弃该群近期已发过的题目并重拉；重拉次数用尽或重拉失败时返回已拉到的最后一道。
+    只有首次拉取失败才抛出异常。
+    """
+    question: CaptchaQuestion | None = None
+    for attempt in range(max(0, config.chiral_verify_dedup_retries) + 1):
+        try:
+            with span("fetch_captcha", attempt=attempt):
+                question = await fetch_captcha(
+                    api_base=config.chiral_verify_api_base,
+                    timeout=config.chiral_verify_api_timeout,
+                )
+        except Exception as e:
+            if question is None:
+                raise
+            logger.warning(f"[手性碳验证] 群 {group_id} 重拉题目失败，发出已拉到的重复题目: {e}")
+            break
+        if check_and_remember(group_id, question.question_id, config.chiral_verify_dedup_window):
+            return question
+        logger.debug(f"[手性碳验证] 群 {group_id} 近期已发过题目 {question.question_id}，重新拉取")
+    else:
+        logger.info(f"[手性碳验证] 群 {group_id} 重拉 {config.chiral_verify_dedup_retries} 次仍为重复题目，照常发出")
+
+    record_exhausted(group_id)
+    return question
+
+
+async def _handle_overload(bot: Bot, user_id: int, group_id: int, flag: str = "") -> None:
+    """待验证会话达到上限（或群处于锁定中）时按配置的策略处理新成员。"""
+    policy = config.chiral_verify_overload_policy
+
+    if policy == "lockdown" and not is_locked_down(group_id):
+        start_lockdown(group_id, config.chiral_verify_lockdown_seconds)
+        logger.warning(
+            f"[手性碳验证] 群 {group_id} 待验证人数达到上限，"
+            f"暂停新验证 {config.chiral_verify_lockdown_seconds} 秒"
+        )
+
+    if policy in ("queue", "lockdown") and enqueue(
+        group_id, user_id, config.chiral_verify_queue_size, flag
+    ):
+        mark("queued", position=queue_length(group_id))
+        logger.info(f"[手性碳验证] {user_id} 进入群 {group_id} 验证队列（{queue_length(group_id)} 人）")
+        return
+
+    logger.warning(f"[手性碳验证] 群 {group_id} 过载，直接{'拒绝申请' if flag else '移出'} {user_id}")
+    await _drop_unverified(bot, user_id, group_id, flag, "overload")
+    finish_trace(user_id, "overload_kick")
+
+
+async def _drop_unverified(bot: Bot, user_id: int, group_id: int, flag: str, reason: str) -> None:
+    """
+    因过载未能发起验证时移出成员（不拒绝再次申请）或拒绝其入群申请。
+    失败只记录日志。
+    """
+    try:
+        with span("kick", reason=reason):
+            if flag:
+                await bot.set_group_add_request(
+                    flag=flag,
+                    sub_type="add",
+                    approve=False,
+                    reason="验证繁忙，请稍后重新申请",
+                )
+            else:
+                await bot.set_group_kick(
+                    group_id=group_id,
+                    user_id=user_id,
+                    reject_add_request=False,
+                )
+    except Exception as e:
+        logger.error(f"[手性碳验证] 移出用户失败: {e}")
+
+
+# 同时进行的排队验证数上限（每个都要拉题、发消息）
+_DRAIN_CONCURRENCY = 5
+
+# 正在进行的排队验证任务（保留引用，防止任务被回收）
+_drain_tasks: Set[asyncio.Task] = set()
+
+
+def _drain_queues(bot: Bot) -> None:
+    """
+    名额释放或锁定结束后，为排队中的新成员发起验证。
+    验证在后台任务中进行（最多 _DRAIN_CONCURRENCY 个），调用方无需等待；
+    每个任务结束后会再次调用本函数补位。
+    """
+    for group_id in queued_groups():
+        while (
+            len(_drain_tasks) < _DRAIN_CONCURRENCY
+            and not is_locked_down(group_id)
+            and queue_length(group_id) > 0
+        ):
+            if not try_admit(
+                group_id,
+                config.chiral_verify_max_sessions,
+                config.chiral_verify_max_sessions_per_group,
+            ):
+                break
+            item = dequeue(group_id)
+            if item is None:
+                release_admit(group_id)
+                break
+            user_id, flag = item
+            task = asyncio.create_task(_verify_queued(bot, user_id, group_id, flag))
+            _drain_tasks.add(task)
+            task.add_done_callback(lambda t: _on_drain_done(bot, t))
+
+
+async def _verify_queued(bot: Bot, user_id: int, group_id: int, flag: str) -> None:
+    try:
+        resume_trace(user_id)
+        mark("dequeued")
+        await _start_verification(bot, user_id, group_id, flag)
+    except Exception as e:
+        logger.error(f"[手性碳验证] 排队验证失败（user={user_id}, group={group_id}）: {e}")
+    finally:
+        release_admit(group_id)
+
+
+def _on_drain_done(bot: Bot, task: asyncio.Task) -> None:
+    _drain_tasks.discard(task)
+    _drain_queues(bot)
+
+
+async def _remove_user(bot: Bot, session: VerifySession, reason: str) -> None:
+    """
+    移出未通过验证的用户：已入群则踢出，入群申请阶段则拒绝申请。
+    失败时抛出异常，由调用方记录。
+    """
+    with span("kick", reason=reason):
+        if session.flag:
+            await bot.set_group_add_request(
+                flag=session.flag,
+                sub_type="add",
+                approve=False,
+                reason=f"手性碳验证未通过（{reason}）",
+            )
+        else:
+            await bot.set_group_kick(
+                group_id=session.group_id,
+                user_id=session.user_id,
+                reject_add_request=True,
+            )
+
+
+async def _approve_request(bot: Bot, user_id: int, group_id: int, flag: str) -> None:
+    """同意入群申请阶段已通过验证的用户，并记录以便入群通知时跳过验证。"""
+    mark_request_approved(user_id, group_id)
+    try:
+        with span("approve_request"):
+            await bot.set_group_add_request(flag=flag, sub_type="add", approve=True)
+    except Exception as e:
+        logger.error(f"[手性碳验证] 同意入群申请失败: {e}")
+
+
 # ---------------------------------------------------------------------------
 # 2. 答案处理器（rule 匹配：纯数字 + 有待验证会话）
 # ---------------------------------------------------------------------------
@@ -192,6 +588,9 @@ def _is_pending_user(event: GroupMessageEvent | PrivateMessageEvent) -> bool:
     return True
 
 
+# 同一用户同时排队处理的答案上限，超出的直接忽略
+_MAX_PENDING_ANSWERS = 3
+
 verify_answer_handler = on_message(
     rule=_is_pending_user,
     permission=GROUP | PRIVATE,
@@ -207,58 +606,114 @@ async def handle_verify_answer(bot: Bot, event: GroupMessageEvent | PrivateMessa
     if not session:
         return
 
-    group_id  = session.group_id
+    group_id = session.group_id
+    if pending_count(user_id, group_id) >= _MAX_PENDING_ANSWERS:
+        logger.debug(f"[手性碳验证] {user_id} 作答过于频繁，已忽略")
+        return
+
+    async with session_lock(user_id, group_id):
+        ended = await _process_answer(bot, event, user_id, group_id)
+    if ended:
+        _drain_queues(bot)
+
+
+async def _process_answer(
+    bot: Bot,
+    event: GroupMessageEvent | PrivateMessageEvent,
+    user_id: int,
+    group_id: int,
+) -> bool:
+    """
+    在 session_lock 内处理一次作答，返回会话是否已结束。
+    会话可能已被排在前面的作答 / 管理员操作结束，需重新读取。
+    """
+    session = get_session(user_id)
+    if not session or session.group_id != group_id:
+        return False
+
     user_text = event.get_plaintext().strip()
+    if session.is_repeat(user_text, config.chiral_verify_answer_debounce):
+        logger.debug(f"[手性碳验证] {user_id} 重复提交相同答案，已忽略")
+        return False
+    session.record_answer(user_text)
+
     correct, feedback = verify_answer(session.question, user_text)
+    resume_trace(user_id)
+    mark("answer", correct=correct, attempt=session.attempts + 1)
 
     if correct:
         remove_session(user_id)
-        await bot.send(event, f"{feedback}\n\n🎉 验证通过，欢迎加入！")
-        try:
-            await bot.send_group_msg(
-                group_id=group_id,
-                message=f"[CQ:at,qq={user_id}] ✅ 验证通过，欢迎！",
-            )
-        except Exception:
-            pass
+        _record_pass(user_id, group_id)
+        if session.flag:
+            await _approve_request(bot, user_id, group_id, session.flag)
+            finish_trace(user_id, "passed")
+            await bot.send(event, f"{feedback}\n\n🎉 验证通过，已同意你的入群申请！")
+        else:
+            finish_trace(user_id, "passed")
+            await bot.send(event, f"{feedback}\n\n🎉 验证通过，欢迎加入！")
+            try:
+                await bot.send_group_msg(
+                    group_id=group_id,
+                    message=f"[CQ:at,qq={user_id}] ✅ 验证通过，欢迎！",
+                )
+            except Exception:
+                pass
         logger.info(f"[手性碳验证] {user_id} 验证通过")
+        return True
 
-    else:
-        attempts  = increment_attempt(user_id)
-        remaining = session.max_attempts - attempts
+    attempts  = increment_attempt(user_id)
+    remaining = session.max_attempts - attempts
 
-        if remaining <= 0:
-            remove_session(user_id)
-            await bot.send(event, f"{feedback}\n\n😔 已超过最大尝试次数，即将移出群聊。")
-            if config.chiral_verify_auto_reject:
-                try:
-                    await bot.set_group_kick(
-                        group_id=group_id,
-                        user_id=user_id,
-                        reject_add_request=True,
-                    )
-                    logger.info(f"[手性碳验证] {user_id} 验证失败，已踢出群 {group_id}")
-                except Exception as e:
-                    logger.error(f"[手性碳验证] 踢出用户失败: {e}")
-        else:
-            await bot.send(
-                event,
-                f"{feedback}\n\n还有 {remaining} 次机会，请重新作答。",
-            )
+    if remaining <= 0:
+        remove_session(user_id)
+        outcome = "入群申请将被拒绝" if session.flag else "即将移出群聊"
+        await bot.send(event, f"{feedback}\n\n😔 已超过最大尝试次数，{outcome}。")
+        if config.chiral_verify_auto_reject:
+            try:
+                await _remove_user(bot, session, "答错次数过多")
+                logger.info(f"[手性碳验证] {user_id} 验证失败，已移出 / 拒绝（群 {group_id}）")
+            except Exception as e:
+                logger.error(f"[手性碳验证] 踢出用户失败: {e}")
+        finish_trace(user_id, "failed")
+        return True
+
+    await bot.send(
+        event,
+        f"{feedback}\n\n还有 {remaining} 次机会，请重新作答。",
+    )
+    return False
 
 
 # ---------------------------------------------------------------------------
 # 帮助：通用 approve/reject 逻辑（供多个 handler 复用）
+# 与作答处理共用 session_lock，同一用户的状态变更依次执行
 # ---------------------------------------------------------------------------
 
 async def _do_approve(bot: Bot, target_id: int) -> str:
     session = get_session(target_id)
     if not session:
         return f"未找到 {target_id} 的待验证会话。"
+    async with session_lock(target_id, session.group_id):
+        result = await _approve_session(bot, target_id, session.group_id)
+    _drain_queues(bot)
+    return result
+
+
+async def _approve_session(bot: Bot, target_id: int, group_id: int) -> str:
+    session = get_session(target_id)
+    if not session or session.group_id != group_id:
+        return f"未找到 {target_id} 的待验证会话。"
     remove_session(target_id)
+    _record_pass(target_id, group_id)
+    resume_trace(target_id)
+    if session.flag:
+        await _approve_request(bot, target_id, group_id, session.flag)
+        finish_trace(target_id, "admin_approved")
+        return f"✅ 已手动通过 {target_id} 的验证，并同意其入群申请。"
+    finish_trace(target_id, "admin_approved")
     try:
         await bot.send_group_msg(
-            group_id=session.group_id,
+            group_id=group_id,
             message=f"✅ 管理员已手动通过 [CQ:at,qq={target_id}] 的验证。",
         )
     except Exception as e:
@@ -270,24 +725,37 @@ async def _do_reject(bot: Bot, target_id: int, reason: str) -> str:
     session = get_session(target_id)
     if not session:
         return f"未找到 {target_id} 的待验证会话。"
+    async with session_lock(target_id, session.group_id):
+        result = await _reject_session(bot, target_id, session.group_id, reason)
+    _drain_queues(bot)
+    return result
+
+
+async def _reject_session(bot: Bot, target_id: int, group_id: int, reason: str) -> str:
+    session = get_session(target_id)
+    if not session or session.group_id != group_id:
+        return f"未找到 {target_id} 的待验证会话。"
     remove_session(target_id)
+    resume_trace(target_id)
+    if verified_cache is not None:
+        verified_cache.revoke(target_id)
+    if not session.flag:
+        try:
+            await bot.send_group_msg(
+                group_id=group_id,
+                message=f"❌ 管理员已拒绝 [CQ:at,qq={target_id}] 的验证，原因：{reason}",
+            )
+        except Exception as e:
+            logger.warning(f"[手性碳验证] 群内通知失败: {e}")
     try:
-        await bot.send_group_msg(
-            group_id=session.group_id,
-            message=f"❌ 管理员已拒绝 [CQ:at,qq={target_id}] 的验证，原因：{reason}",
-        )
-    except Exception as e:
-        logger.warning(f"[手性碳验证] 群内通知失败: {e}")
-    try:
-        await bot.set_group_kick(
-            group_id=session.group_id,
-            user_id=target_id,
-            reject_add_request=True,
-        )
+        await _remove_user(bot, session, reason)
+        action = "拒绝入群申请" if session.flag else "踢出"
+        result = f"❌ 已{action} {target_id}，原因：{reason}"
     except Exception as e:
         logger.error(f"[手性碳验证] 踢出用户失败: {e}")
-        return f"踢出失败：{e}"
-    return f"❌ 已踢出 {target_id}，原因：{reason}"
+        result = f"踢出失败：{e}"
+    finish_trace(target_id, "admin_rejected")
+    return result
 
 
 # ---------------------------------------------------------------------------
@@ -436,13 +904,21 @@ async def handle_help(bot: Bot, event: GroupMessageEvent | PrivateMessageEvent):
 
 
 # ---------------------------------------------------------------------------
-# 8. 定时任务：超时踢出（每 30 秒检查一次）
+# 8. 定时任务：超时踢出、锁定解除、排队超时与排队处理（每 30 秒检查一次）
 # ---------------------------------------------------------------------------
 
 @scheduler.scheduled_job("interval", seconds=30, id="chiral_verify_timeout_check")
 async def check_expired_sessions():
     expired = get_expired_sessions()
-    if not expired:
+    if verified_cache is not None:
+        try:
+            verified_cache.prune()
+            verified_cache.save()
+        except Exception as e:
+            logger.error(f"[手性碳验证] 保存跨群验证缓存失败: {e}")
+    for group_id in pop_finished_lockdowns():
+        logger.info(f"[手性碳验证] 群 {group_id} 锁定结束，恢复验证（排队 {queue_length(group_id)} 人）")
+    if not expired and not queued_groups():
         return
 
     try:
@@ -451,21 +927,150 @@ async def check_expired_sessions():
         logger.warning("[手性碳验证] 获取 bot 实例失败，跳过超时处理")
         return
 
-    for session in expired:
-        logger.info(f"[手性碳验证] 用户 {session.user_id} 验证超时")
+    for stale in expired:
+        async with session_lock(stale.user_id, stale.group_id):
+            await _expire_session(bot, stale.user_id, stale.group_id)
+
+    # 排队超过验证时限仍未轮到的成员按超时处理
+    for group_id, user_id, flag in pop_stale_queued(config.chiral_verify_timeout):
+        logger.info(f"[手性碳验证] 用户 {user_id} 在群 {group_id} 排队超时")
+        resume_trace(user_id)
         if config.chiral_verify_auto_reject:
+            await _drop_unverified(bot, user_id, group_id, flag, "queue_timeout")
+        finish_trace(user_id, "queue_timeout")
+
+    _drain_queues(bot)
+
+
+async def _expire_session(bot: Bot, user_id: int, group_id: int) -> None:
+    """在 session_lock 内处理超时；会话可能已被排在前面的作答 / 管理员操作结束。"""
+    session = pop_expired_session(user_id, group_id)
+    if session is None:
+        return
+
+    logger.info(f"[手性碳验证] 用户 {user_id} 验证超时")
+    resume_trace(user_id)
+    if config.chiral_verify_auto_reject:
+        if not session.flag:
             try:
                 await bot.send_group_msg(
-                    group_id=session.group_id,
-                    message=f"⏰ [CQ:at,qq={session.user_id}] 验证超时，已移出群聊。",
+                    group_id=group_id,
+                    message=f"⏰ [CQ:at,qq={user_id}] 验证超时，已移出群聊。",
                 )
             except Exception:
                 pass
-            try:
-                await bot.set_group_kick(
-                    group_id=session.group_id,
-                    user_id=session.user_id,
-                    reject_add_request=True,
-                )
-            except Exception as e:
-                logger.error(f"[手性碳验证] 超时踢出失败（user={session.user_id}）: {e}")
+        try:
+            await _remove_user(bot, session, "验证超时")
+        except Exception as e:
+            logger.error(f"[手性碳验证] 超时踢出失败（user={user_id}）: {e}")
+    finish_trace(user_id, "timeout")
+
+
+# ---------------------------------------------------------------------------
+# 9. /ccprofile（带前缀，on_command）
+# ---------------------------------------------------------------------------
+
+admin_profile_handler = on_command(
+    "ccprofile",
+    permission=SUPERUSER,
+    priority=1,
+    block=True,
+)
+
+
+@admin_profile_handler.handle()
+async def handle_admin_profile(bot: Bot, event: GroupMessageEvent | PrivateMessageEvent, args: Message = CommandArg()):
+    parts = args.extract_plain_text().strip().split()
+    if len(parts) != 2 or parts[0] not in ("cpu", "lag"):
+        await admin_profile_handler.finish("用法：/ccprofile cpu|lag <秒数>")
+        return
+    try:
+        seconds = int(parts[1])
+    except ValueError:
+        await admin_profile_handler.finish(f"秒数格式不正确：{parts[1]}")
+        return
+    if not 0 < seconds <= config.chiral_verify_profile_max_seconds:
+        await admin_profile_handler.finish(
+            f"秒数需在 1~{config.chiral_verify_profile_max_seconds} 之间。"
+        )
+        return
+    if profiler.is_running():
+        await admin_profile_handler.finish("已有剖析任务在运行，请稍后再试。")
+        return
+
+    mode = parts[0]
+    await bot.send(event, f"🔍 已开始 {mode} 剖析，{seconds} 秒后输出结果。")
+    logger.info(f"[手性碳验证] 开始 {mode} 剖析 {seconds}s（by {event.user_id}）")
+    if mode == "cpu":
+        result = await profiler.run_cpu_profile(seconds, config.chiral_verify_profile_dir)
+    else:
+        result = await profiler.run_lag_monitor(seconds, config.chiral_verify_profile_dir)
+    await admin_profile_handler.finish(result)
+
+
+# ---------------------------------------------------------------------------
+# 10. /ccrevoke（带前缀，on_command）
+# ---------------------------------------------------------------------------
+
+admin_revoke_handler = on_command(
+    "ccrevoke",
+    permission=SUPERUSER,
+    priority=1,
+    block=True,
+)
+
+
+@admin_revoke_handler.handle()
+async def handle_admin_revoke(args: Message = CommandArg()):
+    arg = args.extract_plain_text().strip()
+    if not arg:
+        await admin_revoke_handler.finish("用法：/ccrevoke <QQ号>")
+        return
+    try:
+        target_id = int(arg)
+    except ValueError:
+        await admin_revoke_handler.finish(f"QQ 号格式不正确：{arg}")
+        return
+    if verified_cache is None:
+        await admin_revoke_handler.finish("跨群验证缓存未开启。")
+        return
+    if verified_cache.revoke(target_id):
+        logger.info(f"[手性碳验证] 已撤销 {target_id} 的跨群免验证")
+        await admin_revoke_handler.finish(f"✅ 已撤销 {target_id} 的跨群免验证。")
+    else:
+        await admin_revoke_handler.finish(f"{target_id} 不在跨群验证缓存中。")
+
+
+# ---------------------------------------------------------------------------
+# 11. /ccdedup（带前缀，on_command）
+# ---------------------------------------------------------------------------
+
+admin_dedup_handler = on_command(
+    "ccdedup",
+    permission=SUPERUSER,
+    priority=1,
+    block=True,
+)
+
+
+@admin_dedup_handler.handle()
+async def handle_admin_dedup():
+    stats = get_dedup_stats()
+    if not stats:
+        await admin_dedup_handler.finish(
+            f"暂无去重记录（窗口 {config.chiral_verify_dedup_window} 题，"
+            f"最多重拉 {config.chiral_verify_dedup_retries} 次）。"
+        )
+        return
+    lines = [
+        f"🔁 题目去重统计（窗口 {config.chiral_verify_dedup_window} 题，"
+        f"最多重拉 {config.chiral_verify_dedup_retries} 次）"
+    ]
+    for group_id, st in sorted(stats.items()):
+        total = st.hits + st.misses
+        rate = st.hits / total * 100 if total else 0.0
+        lines.append(
+            f"群 {group_id}：重复 {st.hits} / 新题 {st.misses}（重复率 {rate:.1f}%），"
+            f"重拉用尽 {st.exhausted} 次"
+        )
+    await admin_dedup_handler.finish("\n".join(lines))
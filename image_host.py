@@ -0,0 +1,128 @@
+"""
+chiral_carbon_verify/image_host.py
+题目图片本地托管
+
+将题目图片按内容哈希写入本地目录，消息段中只携带短 URL，
+避免每次发题都通过 OneBot 连接传输整段 base64：
+    file — file:// 绝对路径（OneBot 实现与机器人在同一台机器时使用）
+    http — 由内置的极简 HTTP 服务提供图片
+
+同一张图片被多个会话引用时只保存一份，引用计数归零后删除文件。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from .questions import decode_image
+
+
+_NAME_RE = re.compile(r"[0-9a-f]{64}\.png")
+
+# 读取请求行 / 请求头的超时（秒）
+_READ_TIMEOUT = 10.0
+
+
+class ImageHost:
+    def __init__(self, directory: str, mode: str, base_url: str = ""):
+        self.directory = Path(directory).resolve()
+        self.mode = mode
+        self.base_url = base_url.rstrip("/")
+        self._refs: Dict[str, int] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    # -----------------------------------------------------------------
+    # 文件管理
+    # -----------------------------------------------------------------
+
+    def publish(self, image_b64: str) -> str:
+        """写入图片（已存在则复用）并增加引用，返回文件名。"""
+        data = decode_image(image_b64)
+        name = f"{hashlib.sha256(data).hexdigest()}.png"
+        path = self.directory / name
+        if name not in self._refs or not path.exists():
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        self._refs[name] = self._refs.get(name, 0) + 1
+        return name
+
+    def release(self, name: str) -> None:
+        """减少引用，归零时删除文件。"""
+        left = self._refs.get(name, 0) - 1
+        if left > 0:
+            self._refs[name] = left
+            return
+        self._refs.pop(name, None)
+        (self.directory / name).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """删除目录中残留的图片（启动 / 关闭时调用）。"""
+        self._refs.clear()
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.iterdir():
+            if _NAME_RE.fullmatch(path.name) or path.suffix == ".tmp":
+                path.unlink(missing_ok=True)
+
+    def url_for(self, name: str) -> str:
+        if self.mode == "file":
+            return (self.directory / name).as_uri()
+        return f"{self.base_url}/{name}"
+
+    # -----------------------------------------------------------------
+    # HTTP 服务
+    # -----------------------------------------------------------------
+
+    async def start_http(self, host: str, port: int) -> None:
+        if self._server is None:
+            self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop_http(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), _READ_TIMEOUT)
+            while True:
+                header = await asyncio.wait_for(reader.readline(), _READ_TIMEOUT)
+                if header in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request_line.decode("latin-1").split()
+            method = parts[0] if parts else ""
+            name = parts[1].lstrip("/") if len(parts) > 1 else ""
+            body = b""
+            status = "404 Not Found"
+            if method not in ("GET", "HEAD"):
+                status = "405 Method Not Allowed"
+            elif _NAME_RE.fullmatch(name) and name in self._refs:
+                try:
+                    body = (self.directory / name).read_bytes()
+                    status = "200 OK"
+                except OSError:
+                    pass
+
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {'image/png' if body else 'text/plain'}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: close\r\n\r\n"
+                ).encode("latin-1")
+            )
+            if method == "GET":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,122 @@
+"""
+chiral_carbon_verify/profiler.py
+按需性能剖析
+
+供超级管理员临时开启，运行指定秒数后将结果写入文件：
+    cpu — 采样剖析：后台线程定时抓取事件循环线程的调用栈，开销与调用次数无关
+    lag — 事件循环延迟监测（定期 sleep，统计实际唤醒的滞后）
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+
+# 同一时间只允许一个剖析任务
+_lock = asyncio.Lock()
+
+# 调用栈采样间隔（秒）
+_SAMPLE_INTERVAL = 0.01
+
+# 延迟监测的采样间隔（秒）
+_LAG_INTERVAL = 0.05
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+async def run_cpu_profile(seconds: float, out_dir: str) -> str:
+    """
+    对事件循环线程做 seconds 秒的调用栈采样，写出折叠栈文件（可直接生成火焰图）与文本摘要。
+    :returns: 文本摘要（自身 / 累计采样数前 15 项）
+    """
+    async with _lock:
+        target = threading.get_ident()
+        stacks, total = await asyncio.to_thread(_sample_stacks, target, seconds)
+
+        path = _out_path(out_dir, "cpu", "folded")
+        path.write_text(
+            "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()),
+            encoding="utf-8",
+        )
+        summary = _summarize(stacks, total, 15)
+        path.with_suffix(".txt").write_text(summary, encoding="utf-8")
+        return f"采样剖析结果已写入 {path}\n" + summary
+
+
+def _sample_stacks(target: int, seconds: float) -> Tuple["Counter[Tuple[str, ...]]", int]:
+    """在独立线程中运行：按固定间隔抓取 target 线程的调用栈（根在前）。"""
+    stacks: "Counter[Tuple[str, ...]]" = Counter()
+    total = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(target)
+        stack: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            stacks[tuple(reversed(stack))] += 1
+            total += 1
+        time.sleep(_SAMPLE_INTERVAL)
+    return stacks, total
+
+
+def _summarize(stacks: "Counter[Tuple[str, ...]]", total: int, top: int) -> str:
+    if not total:
+        return "无采样。"
+    own: "Counter[str]" = Counter()
+    cumulative: "Counter[str]" = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for func in set(stack):
+            cumulative[func] += count
+
+    lines = [f"共 {total} 次采样（间隔 {_SAMPLE_INTERVAL * 1000:.0f} ms）", "", "自身占比："]
+    lines += [f"  {n / total * 100:5.1f}%  {func}" for func, n in own.most_common(top)]
+    lines += ["", "累计占比："]
+    lines += [f"  {n / total * 100:5.1f}%  {func}" for func, n in cumulative.most_common(top)]
+    return "\n".join(lines)
+
+
+async def run_lag_monitor(seconds: float, out_dir: str) -> str:
+    """
+    监测事件循环延迟 seconds 秒，写出每次采样的滞后（毫秒）。
+    :returns: 统计摘要
+    """
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        lags: List[float] = []
+        deadline = loop.time() + seconds
+        while loop.time() < deadline:
+            expected = loop.time() + _LAG_INTERVAL
+            await asyncio.sleep(_LAG_INTERVAL)
+            lags.append(max(0.0, (loop.time() - expected) * 1000))
+
+        path = _out_path(out_dir, "lag", "txt")
+        path.write_text("\n".join(f"{v:.2f}" for v in lags), encoding="utf-8")
+
+        if not lags:
+            return f"事件循环延迟：无采样，结果文件 {path}"
+        ordered = sorted(lags)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return (
+            f"事件循环延迟结果已写入 {path}\n"
+            f"采样 {len(lags)} 次，平均 {sum(lags) / len(lags):.1f} ms，"
+            f"P95 {p95:.1f} ms，最大 {ordered[-1]:.1f} ms"
+        )
+
+
+def _out_path(out_dir: str, kind: str, suffix: str) -> Path:
+    directory = Path(out_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{suffix}"
+
@@ -101,15 +101,19 @@ async def fetch_captcha(api_base: str, timeout: float = 10.0) -> CaptchaQuestion
 # 图片工具
 # ---------------------------------------------------------------------------
 
+def decode_image(image_b64: str) -> bytes:
+    """解码 data URI 或裸 base64 字符串，返回图片字节。"""
+    if "," in image_b64:          # 去掉 data URI 前缀
+        image_b64 = image_b64.split(",", 1)[1]
+    return base64.b64decode(image_b64)
+
+
 def save_image_to_temp(image_b64: str) -> str:
     """
     将 base64 图片写入临时 PNG 文件，返回文件路径。
     调用方负责删除该文件（os.unlink）。
     """
-    if "," in image_b64:          # 去掉 data URI 前缀
-        image_b64 = image_b64.split(",", 1)[1]
-
-    img_bytes = base64.b64decode(image_b64)
+    img_bytes = decode_image(image_b64)
     tmp = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
     tmp.write(img_bytes)
     tmp.close()
@@ -3,9 +3,11 @@ chiral_carbon_verify/session.py
 会话状态管理器
 """
 
+import asyncio
 import time
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 from .questions import CaptchaQuestion
 
@@ -19,10 +21,32 @@ class VerifySession:
     max_attempts: int = 3
     created_at: float = field(default_factory=time.time)
     timeout: int = 120
+    image_name: str = ""      # 本地托管的题目图片文件名（未托管时为空）
+    flag: str = ""            # 入群申请 flag（申请阶段验证时非空）
+    last_answer: str = ""     # 最近一次处理的答案（用于去抖）
+    last_answer_at: float = 0.0
+
+    def is_repeat(self, answer: str, window: float) -> bool:
+        """window 秒内重复提交的相同答案视为重复。"""
+        return answer == self.last_answer and time.time() - self.last_answer_at < window
+
+    def record_answer(self, answer: str) -> None:
+        self.last_answer = answer
+        self.last_answer_at = time.time()
 
 
 _sessions: Dict[int, VerifySession] = {}
 
+# 各群待验证会话数，与 _sessions 同步维护，便于 O(1) 判断群内上限
+_group_counts: Dict[int, int] = {}
+
+# 会话结束（通过 / 失败 / 超时 / 被替换）时的回调，用于释放会话占用的资源
+_end_hooks: List[Callable[[VerifySession], None]] = []
+
+
+def add_session_end_hook(hook: Callable[[VerifySession], None]) -> None:
+    _end_hooks.append(hook)
+
 
 def create_session(
     user_id: int,
@@ -30,6 +54,7 @@ def create_session(
     question: CaptchaQuestion,
     max_attempts: int = 3,
     timeout: int = 120,
+    flag: str = "",
 ) -> VerifySession:
     session = VerifySession(
         user_id=user_id,
@@ -37,21 +62,45 @@ def create_session(
         question=question,
         max_attempts=max_attempts,
         timeout=timeout,
+        flag=flag,
     )
+    _pop_session(user_id)
     _sessions[user_id] = session
+    _group_counts[group_id] = _group_counts.get(group_id, 0) + 1
     return session
 
 
 def get_session(user_id: int) -> Optional[VerifySession]:
+    """返回未过期的会话。已过期的会话保留在表中，由超时任务取出并处理。"""
     session = _sessions.get(user_id)
     if session and _is_expired(session):
-        del _sessions[user_id]
         return None
     return session
 
 
 def remove_session(user_id: int) -> None:
-    _sessions.pop(user_id, None)
+    _pop_session(user_id)
+
+
+def count_sessions() -> int:
+    return len(_sessions)
+
+
+def count_group_sessions(group_id: int) -> int:
+    return _group_counts.get(group_id, 0)
+
+
+def _pop_session(user_id: int) -> Optional[VerifySession]:
+    session = _sessions.pop(user_id, None)
+    if session is not None:
+        left = _group_counts.get(session.group_id, 0) - 1
+        if left > 0:
+            _group_counts[session.group_id] = left
+        else:
+            _group_counts.pop(session.group_id, None)
+        for hook in _end_hooks:
+            hook(session)
+    return session
 
 
 def _is_expired(session: VerifySession) -> bool:
@@ -59,10 +108,16 @@ def _is_expired(session: VerifySession) -> bool:
 
 
 def get_expired_sessions() -> List[VerifySession]:
-    expired = [s for s in list(_sessions.values()) if _is_expired(s)]
-    for s in expired:
-        _sessions.pop(s.user_id, None)
-    return expired
+    """列出已过期的会话（不移除），处理时应在 session_lock 内调用 pop_expired_session。"""
+    return [s for s in _sessions.values() if _is_expired(s)]
+
+
+def pop_expired_session(user_id: int, group_id: int) -> Optional[VerifySession]:
+    """若该用户在该群的会话仍存在且已过期，则移除并返回；否则返回 None。"""
+    session = _sessions.get(user_id)
+    if session is None or session.group_id != group_id or not _is_expired(session):
+        return None
+    return _pop_session(user_id)
 
 
 def increment_attempt(user_id: int) -> int:
@@ -71,3 +126,67 @@ def increment_attempt(user_id: int) -> int:
         session.attempts += 1
         return session.attempts
     return 0
+
+
+# ---------------------------------------------------------------------------
+# 已在入群申请阶段处理过的用户（等待入群通知）
+#   verified=True  — 已通过验证，入群时跳过验证
+#   verified=False — 无法私聊而直接同意，入群时仍需验证，但不再重复计入入群速率
+# ---------------------------------------------------------------------------
+
+# 记录保留时长（秒），超出后视为入群通知已丢失
+_REQUEST_APPROVED_TTL = 600
+
+_request_approved: Dict[Tuple[int, int], Tuple[float, bool]] = {}
+
+
+def mark_request_approved(user_id: int, group_id: int, verified: bool = True) -> None:
+    now = time.time()
+    for key in [k for k, (t, _) in _request_approved.items() if now - t > _REQUEST_APPROVED_TTL]:
+        del _request_approved[key]
+    _request_approved[(user_id, group_id)] = (now, verified)
+
+
+def pop_request_approved(user_id: int, group_id: int) -> Optional[bool]:
+    """返回记录的 verified；无记录或已过期时返回 None。"""
+    entry = _request_approved.pop((user_id, group_id), None)
+    if entry is None or time.time() - entry[0] > _REQUEST_APPROVED_TTL:
+        return None
+    return entry[1]
+
+
+# ---------------------------------------------------------------------------
+# 按 (user_id, group_id) 串行处理状态变更
+# ---------------------------------------------------------------------------
+
+_locks: Dict[Tuple[int, int], asyncio.Lock] = {}
+# 持有或等待各锁的协程数，归零时删除锁，避免锁表无限增长
+_lock_users: Dict[Tuple[int, int], int] = {}
+
+
+def pending_count(user_id: int, group_id: int) -> int:
+    """正在处理或排队等待处理的请求数。"""
+    return _lock_users.get((user_id, group_id), 0)
+
+
+@asynccontextmanager
+async def session_lock(user_id: int, group_id: int) -> AsyncIterator[None]:
+    """
+    同一用户在同一群的答案 / 管理员操作依次执行。
+    进入后应重新 get_session，会话可能已被前一个操作结束。
+    """
+    key = (user_id, group_id)
+    lock = _locks.get(key)
+    if lock is None:
+        lock = _locks[key] = asyncio.Lock()
+    _lock_users[key] = _lock_users.get(key, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        left = _lock_users[key] - 1
+        if left > 0:
+            _lock_users[key] = left
+        else:
+            del _lock_users[key]
+            del _locks[key]
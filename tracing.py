@@ -0,0 +1,167 @@
+"""
+chiral_carbon_verify/tracing.py
+单次验证的链路追踪
+
+每个入群用户对应一条 trace，按阶段记录 span：
+    join → fetch_captcha → send_private → send_group_fallback → answer → kick
+
+当前 trace 通过 contextvars 在协程内传递，跨事件（入群 / 作答 / 超时）
+则按 user_id 从登记表中恢复。trace 结束时以一行 JSON 写入本地滚动文件，
+写文件在后台线程完成，不阻塞事件循环。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# 同时保留的未结束 trace 上限，超出时最旧的一条以 "evicted" 结束
+_MAX_OPEN_TRACES = 1024
+
+
+@dataclass
+class VerifyTrace:
+    user_id: int
+    group_id: int
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.time)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+
+
+_current_trace: ContextVar[Optional[VerifyTrace]] = ContextVar(
+    "chiral_verify_trace", default=None
+)
+_open_traces: "OrderedDict[int, VerifyTrace]" = OrderedDict()
+
+_trace_logger = logging.getLogger("chiral_carbon_verify.trace")
+_trace_logger.propagate = False
+_listener: Optional[QueueListener] = None
+
+
+# ---------------------------------------------------------------------------
+# 输出
+# ---------------------------------------------------------------------------
+
+def setup_trace_writer(path: str, max_bytes: int, backup_count: int) -> None:
+    """
+    初始化滚动 trace 文件。未调用时 trace 仍会记录，但不会落盘。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    _trace_logger.addHandler(QueueHandler(log_queue))
+    _trace_logger.setLevel(logging.INFO)
+    _listener = QueueListener(log_queue, file_handler)
+    _listener.start()
+
+
+def stop_trace_writer() -> None:
+    """写完队列中剩余的 trace 并关闭文件（关闭时调用）。"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in list(_trace_logger.handlers):
+        _trace_logger.removeHandler(handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def _write(trace: VerifyTrace, outcome: str) -> None:
+    if _listener is None:
+        return
+    record = {
+        "trace_id": trace.trace_id,
+        "user_id": trace.user_id,
+        "group_id": trace.group_id,
+        "started_at": round(trace.started_at, 3),
+        "total_ms": round((time.time() - trace.started_at) * 1000, 1),
+        "outcome": outcome,
+        "spans": trace.spans,
+    }
+    _trace_logger.info(json.dumps(record, ensure_ascii=False))
+
+
+# ---------------------------------------------------------------------------
+# trace 生命周期
+# ---------------------------------------------------------------------------
+
+def start_trace(user_id: int, group_id: int) -> VerifyTrace:
+    """为新入群用户开启 trace，并设为当前上下文的 trace。"""
+    old = _open_traces.pop(user_id, None)
+    if old is not None:
+        _write(old, "superseded")
+    while len(_open_traces) >= _MAX_OPEN_TRACES:
+        _, evicted = _open_traces.popitem(last=False)
+        _write(evicted, "evicted")
+
+    trace = VerifyTrace(user_id=user_id, group_id=group_id)
+    _open_traces[user_id] = trace
+    _current_trace.set(trace)
+    return trace
+
+
+def resume_trace(user_id: int) -> Optional[VerifyTrace]:
+    """在后续事件中恢复该用户的 trace（不存在则返回 None）。"""
+    trace = _open_traces.get(user_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(user_id: int, outcome: str) -> None:
+    """结束该用户的 trace 并写入文件。"""
+    trace = _open_traces.pop(user_id, None)
+    if trace is None:
+        return
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    _write(trace, outcome)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    记录当前 trace 中的一个阶段。
+    产出的 dict 可在 with 块内补充属性；异常会被记录后原样抛出。
+    """
+    entry: Dict[str, Any] = {"name": name, **attrs}
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    entry["offset_ms"] = (
+        round((time.time() - trace.started_at) * 1000, 1) if trace else 0.0
+    )
+    try:
+        yield entry
+    except Exception as e:
+        entry["error"] = repr(e)
+        raise
+    finally:
+        entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if trace is not None:
+            trace.spans.append(entry)
+
+
+def mark(name: str, **attrs: Any) -> None:
+    """记录一个瞬时事件（duration 为 0 的 span）。"""
+    with span(name, **attrs):
+        pass
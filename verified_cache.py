@@ -0,0 +1,96 @@
+"""
+chiral_carbon_verify/verified_cache.py
+跨群已验证用户缓存
+
+记录通过验证（含管理员手动通过）的用户，在有效期内加入其他共享缓存的群时免验证。
+容量有上限，超出时淘汰最早的记录；数据保存为 JSON 文件，由定时任务批量落盘。
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class VerifiedCache:
+    def __init__(self, path: str, ttl: int, max_size: int):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        # user_id → 通过验证的时间戳，按时间先后排列
+        self._entries: "OrderedDict[int, float]" = OrderedDict()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # -----------------------------------------------------------------
+    # 查询与修改
+    # -----------------------------------------------------------------
+
+    def add(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = time.time()
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def contains(self, user_id: int) -> bool:
+        ts = self._entries.get(user_id)
+        if ts is None:
+            return False
+        if time.time() - ts > self.ttl:
+            del self._entries[user_id]
+            self._dirty = True
+            return False
+        return True
+
+    def revoke(self, user_id: int) -> bool:
+        if self._entries.pop(user_id, None) is None:
+            return False
+        self._dirty = True
+        return True
+
+    def prune(self) -> int:
+        """删除过期记录，返回删除数量。记录按时间排列，只需从头部检查。"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        while self._entries:
+            user_id, ts = next(iter(self._entries.items()))
+            if ts > cutoff:
+                break
+            del self._entries[user_id]
+            removed += 1
+        if removed:
+            self._dirty = True
+        return removed
+
+    # -----------------------------------------------------------------
+    # 持久化
+    # -----------------------------------------------------------------
+
+    def load(self) -> None:
+        if not self.path.is_file():
+            return
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        items = sorted(((int(uid), float(ts)) for uid, ts in data.items()), key=lambda x: x[1])
+        self._entries = OrderedDict(items[-self.max_size:] if self.max_size > 0 else [])
+        self.prune()
+        self._dirty = False
+
+    def save(self, force: bool = False) -> Optional[int]:
+        """有改动（或 force）时写入文件，返回写入条数；无需写入时返回 None。"""
+        if not (self._dirty or force):
+            return None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({str(uid): ts for uid, ts in self._entries.items()}),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+        self._dirty = False
+        return len(self._entries)